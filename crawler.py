@@ -1,26 +1,82 @@
+import math
 import os
+import re
+import heapq
+import random
 import threading
 import queue
 import time
 import gzip
 import io
-from typing import Optional, List, Dict, Any
-from collections import deque
+from typing import IO, Optional, List, Dict, Any, Tuple
 
 import json
 import requests
+from requests.adapters import HTTPAdapter
+try:
+    from pybloom_live import ScalableBloomFilter
+except ImportError:  # optional; fall back to an exact in-memory set
+    ScalableBloomFilter = None
+try:
+    import orjson
+except ImportError:  # optional fast serializer; fall back to stdlib json
+    orjson = None
 import logging
 from logging.handlers import RotatingFileHandler
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urldefrag, urlparse
+from bs4 import BeautifulSoup, NavigableString, Tag
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # optional C parser; fall back to BeautifulSoup
+    LexborHTMLParser = None
+from urllib.parse import unquote_plus, urljoin, urlsplit, urlunsplit
 import xml.etree.ElementTree as ET
+try:
+    from lxml import etree
+except ImportError:  # optional C parser; fall back to xml.etree
+    etree = None
 
-from scraper import scrape_html
+from scraper import NON_TEXT_TAGS, has_non_text_ancestor, scrape_html
 from db import CrawlerDB
+from urlutils import canon_host
+from workqueue import WorkStealingQueue
 
 
 USER_AGENT = "TerminalCrawler/1.0 (+https://example.com/bot)"  # change to your own identifier if desired
 MAX_RETRIES = 3
+RETRY_BACKOFF_MAX = 60  # seconds, before jitter
+STATUS_FLUSH_EVERY = 64  # buffered status updates per worker
+STATUS_FLUSH_INTERVAL = 0.25  # seconds
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Query parameters dropped during URL canonicalization (plus any utm_*)
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "msclkid"})
+HTTP_POOL_CONNECTIONS = 64  # hosts with cached connection pools per worker
+HTTP_POOL_MAXSIZE = 64  # connections kept per host pool
+SEEN_INITIAL_CAPACITY = 1_000_000
+SEEN_ERROR_RATE = 0.001
+JSON_BUFFER_SIZE = 1024 * 1024
+SNIPPET_CHARS = 200  # visible text kept for the [CONTENT] log line
+SITEMAP_SNIFF_BYTES = 512
+# First element start tag; "<?xml" and "<!DOCTYPE" don't match
+# Second group is the delimiter after the name; missing when the head cuts the name off
+_XML_ROOT_RE = re.compile(rb"<([A-Za-z_][\w.:-]*)([\s/>])?")
+JSON_FLUSH_EVERY = 100  # records
+JSON_FLUSH_INTERVAL = 2.0  # seconds
+# CPUs to pin workers to, e.g. "0-15" or "[0-3,8-11]"; defaults to the allowed CPU set
+WORKER_AFFINITY_ENV = "CRAWLER_WORKER_AFFINITY"
+AUTO_THREADS_MAX = 64
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_CFS_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_CFS_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+# Adaptive worker count (opt-in): park workers while we use more than our fair
+# share of a saturated host. Set CRAWLER_ADAPTIVE_WORKERS=1 to enable.
+ADAPTIVE_WORKERS_ENV = "CRAWLER_ADAPTIVE_WORKERS"
+PROC_STAT = "/proc/stat"
+ADAPTIVE_INTERVAL = 0.2  # seconds between CPU samples
+ADAPTIVE_BUSY_THRESHOLD = 0.85  # host-wide busy fraction that counts as contention
+ADAPTIVE_FAIR_SHARE = 0.5  # fraction of host CPUs we may use while it is contended
+ADAPTIVE_HYSTERESIS = 0.2  # shrink above fair * (1 + h), grow below fair * (1 - h)
+ADAPTIVE_GROWTH = 1.25  # max factor the target grows by per sample
+ADAPTIVE_SMOOTHING = 0.3  # EWMA weight of the newest CPU usage sample
 
 
 class Crawler:
@@ -31,6 +87,10 @@ class Crawler:
 
         self.json_lock = threading.Lock()
         self.json_path = os.path.join(os.path.dirname(self.db_path), "scraped_data.jsonl")
+        # Kept open for the crawler's lifetime; flushed every JSON_FLUSH_EVERY records
+        # or JSON_FLUSH_INTERVAL seconds, whichever comes first.
+        self._json_fh = open(self.json_path, "ab", buffering=JSON_BUFFER_SIZE)
+        self._json_unflushed = 0
         self.db = CrawlerDB(self.db_path)
 
         # Determine a "main domain" for UI filtering: infer from earliest DB entry if available
@@ -38,11 +98,7 @@ class Crawler:
         try:
             first = self.db.get_earliest_url()
             if first:
-                p = urlparse(first)
-                host = p.netloc.lower()
-                if host.startswith("www."):
-                    host = host[4:]
-                self.main_domain = host
+                self.main_domain = canon_host(first)
         except Exception:
             self.main_domain = None
 
@@ -60,27 +116,100 @@ class Crawler:
 
         self.logger.info(f"Initialized Crawler(db={self.db_path!r}, workers={self.num_workers}, delay={self.delay_seconds})")
 
-        self.pending_queue: "queue.Queue[str]" = queue.Queue()
+        self.pending_queue = WorkStealingQueue(self.num_workers)
         self.stop_event = threading.Event()
         self.workers: List[threading.Thread] = []
 
+        # Per-worker status updates, written in batches by _flush_status_updates
+        self._status_buffers: List[List[Dict[str, Any]]] = [[] for _ in range(self.num_workers)]
+        self._status_locks = [threading.Lock() for _ in range(self.num_workers)]
+
+        # Failed fetches wait here as (next_try_ts, url) until their backoff expires
+        self._retry_heap: List[Tuple[float, str]] = []
+        self._retry_lock = threading.Lock()
+        self._retry_cond = threading.Condition(self._retry_lock)
+
+        # Workers with worker_id >= _active_worker_target park until it rises again
+        self._active_worker_target = self.num_workers
+        self._park_cond = threading.Condition()
+
+        # Every URL known to the DB, so rediscovered links skip the DB round-trip
+        self.seen_path = os.path.join(os.path.dirname(self.db_path), "seen_urls.bloom")
+        self._seen = self._load_seen_filter()
+        self._seen_lock = threading.Lock()
+
         self._load_pending_into_queue()
 
+    def _load_seen_filter(self):
+        """
+        Build the seen-URL filter. With pybloom_live this is a scalable Bloom
+        filter (~1-2 bytes/URL; a false positive skips a new URL at SEEN_ERROR_RATE),
+        restored from `seen_path` when it still fits the DB. Otherwise a set.
+        """
+        if ScalableBloomFilter is None:
+            return set(self.db.iter_all_urls())
+
+        if os.path.exists(self.seen_path):
+            try:
+                with open(self.seen_path, "rb") as f:
+                    bf = ScalableBloomFilter.fromfile(f)
+                # Every filtered URL was inserted into the DB, so a larger filter
+                # means the DB was reset and the saved filter no longer applies.
+                if len(bf) <= self.db.count_urls():
+                    return bf
+            except Exception as e:
+                self.logger.warning(f"Ignoring unreadable seen filter {self.seen_path!r}: {e}")
+
+        bf = ScalableBloomFilter(initial_capacity=SEEN_INITIAL_CAPACITY, error_rate=SEEN_ERROR_RATE)
+        for url in self.db.iter_all_urls():
+            bf.add(url)
+        return bf
+
+    def _save_seen_filter(self) -> None:
+        if ScalableBloomFilter is None:
+            return
+        try:
+            with self._seen_lock:
+                with open(self.seen_path, "wb") as f:
+                    self._seen.tofile(f)
+        except Exception as e:
+            self.logger.warning(f"Could not save seen filter to {self.seen_path!r}: {e}")
+
     def _load_pending_into_queue(self) -> None:
         for url in self.db.load_pending_urls():
             self.pending_queue.put(url)
 
     def _save_json_record(self, data: Dict[str, Any]) -> None:
+        if orjson is not None:
+            line = orjson.dumps(data) + b"\n"
+        else:
+            line = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
         with self.json_lock:
-            with open(self.json_path, "a", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False)
-                f.write("\n")
+            if self._json_fh.closed:
+                # Raise so the caller retries the URL instead of marking it visited
+                raise ValueError("JSON output is closed; crawler is stopping")
+            self._json_fh.write(line)
+            self._json_unflushed += 1
+            if self._json_unflushed >= JSON_FLUSH_EVERY:
+                self._flush_json_locked()
         # Log saved record (core fields)
         try:
             self.logger.info(f"Saved record: {data.get('url')!r} status={data.get('status_code')}")
         except Exception:
             pass
 
+    def _flush_json_locked(self) -> None:
+        # Caller must hold json_lock
+        if not self._json_fh.closed:
+            self._json_fh.flush()
+        self._json_unflushed = 0
+
+    def _json_flush_loop(self) -> None:
+        while not self.stop_event.wait(JSON_FLUSH_INTERVAL):
+            with self.json_lock:
+                if self._json_unflushed:
+                    self._flush_json_locked()
+
     def get_status_counts(self):
         return self.db.get_status_counts()
 
@@ -95,27 +224,49 @@ class Crawler:
 
         is_sitemap = 1 if self._looks_like_sitemap(url) else 0
         inserted = self.db.insert_or_ignore_url(url, status="pending", is_sitemap=is_sitemap)
+        with self._seen_lock:
+            self._seen.add(url)
         if inserted:
             self.pending_queue.put(url)
             print(f"Seeded URL: {url}")
             self.logger.info(f"Seeded URL: {url}")
             # if we don't yet have a main_domain, use the first seed's host
             if not self.main_domain:
-                try:
-                    p = urlparse(url)
-                    host = p.netloc.lower()
-                    if host.startswith("www."):
-                        host = host[4:]
-                    self.main_domain = host
-                except Exception:
-                    pass
+                self.main_domain = canon_host(url)
         else:
             print(f"URL already known (skipped): {url}")
             self.logger.debug(f"Seed skipped (exists): {url}")
 
+    def add_seed_urls(self, urls: List[str]) -> int:
+        """Seed many URLs with one bulk DB insert; returns how many were new."""
+        rows: Dict[str, int] = {}
+        invalid = 0
+        for raw in urls:
+            url = self._normalize_url(raw.strip())
+            if not url:
+                invalid += 1
+                continue
+            rows[url] = 1 if self._looks_like_sitemap(url) else 0
+
+        inserted = self.db.insert_or_ignore_urls_bulk(list(rows.items())) if rows else []
+        with self._seen_lock:
+            for url in rows:
+                self._seen.add(url)
+        for url in inserted:
+            self.pending_queue.put(url)
+            self.logger.info(f"Seeded URL: {url}")
+        if inserted and not self.main_domain:
+            self.main_domain = canon_host(inserted[0])
+
+        skipped = len(rows) - len(inserted)
+        print(
+            f"Seeded {len(inserted)} URL(s); skipped {skipped} already known"
+            + (f", {invalid} invalid" if invalid else "")
+        )
+        return len(inserted)
+
     def pause_url(self, url: str, reason: str = "user-pause") -> None:
-        url = self._normalize_url(url)
-        row = self.db.get_url_row(url)
+        url, row = self._find_known_url(url)
         if not row:
             print(f"URL not found in DB: {url}")
             return
@@ -126,48 +277,13 @@ class Crawler:
 
     def pause_prefix(self, prefix: str, reason: str = "user-pause-prefix") -> None:
         affected = self.db.pause_prefix(prefix, reason)
-        # Also remove matching items from the in-memory pending queue so workers don't
-        # pick them up after a pause. This is best-effort and uses the queue's mutex
-        # to mutate the underlying deque atomically.
-        removed = self._remove_from_pending_queue(prefix)
-        print(f"Paused {affected} URL(s) with prefix: {prefix} (removed {removed} from in-memory queue)")
-        self.logger.info(
-            f"Paused {affected} URL(s) with prefix: {prefix} reason={reason} removed_from_queue={removed}"
-        )
-
-    def _remove_from_pending_queue(self, prefix: str) -> int:
-        """
-        Remove queued URLs that start with `prefix` from the in-memory pending queue.
-        Returns the number removed. This manipulates the queue internals under the
-        queue mutex to avoid race conditions with consumer threads.
-        """
-        removed = 0
-        try:
-            with self.pending_queue.mutex:
-                q = self.pending_queue.queue  # this is a collections.deque
-                new_q = deque()
-                while q:
-                    try:
-                        u = q.popleft()
-                    except IndexError:
-                        break
-                    if isinstance(u, str) and u.startswith(prefix):
-                        removed += 1
-                    else:
-                        new_q.append(u)
-                # replace underlying deque
-                self.pending_queue.queue = new_q
-        except Exception as e:
-            # Log and continue — removal is best-effort
-            try:
-                self.logger.exception(f"Error removing from pending queue for prefix {prefix}: {e}")
-            except Exception:
-                pass
-        return removed
+        # Queued copies are not removed eagerly; workers drop them when popped.
+        self.pending_queue.drop_prefix(prefix)
+        print(f"Paused {affected} URL(s) with prefix: {prefix}")
+        self.logger.info(f"Paused {affected} URL(s) with prefix: {prefix} reason={reason}")
 
     def resume_url(self, url: str) -> None:
-        url = self._normalize_url(url)
-        row = self.db.get_url_row(url)
+        url, row = self._find_known_url(url)
         if not row:
             print(f"URL not found in DB: {url}")
             return
@@ -180,6 +296,15 @@ class Crawler:
         print(f"Resumed URL: {url}")
         self.logger.info(f"Resumed URL: {url}")
 
+    def resume_urls(self, urls: List[str]) -> int:
+        """Resume many paused URLs in one DB transaction; returns the number resumed."""
+        resumed = self.db.resume_urls(urls)
+        for u in resumed:
+            self.pending_queue.put(u)
+        if resumed:
+            self.logger.info(f"Resumed {len(resumed)} URL(s)")
+        return len(resumed)
+
     def resume_prefix(self, prefix: str) -> None:
         urls, affected = self.db.resume_prefix(prefix)
 
@@ -213,6 +338,11 @@ class Crawler:
         except Exception:
             earliest = None
 
+        try:
+            top_paused_domains = self.db.get_host_counts(top_n, status="paused")
+        except Exception:
+            top_paused_domains = []
+
         paused_urls = []
         try:
             paused_urls = self.db.list_paused_urls()
@@ -221,49 +351,24 @@ class Crawler:
 
         from collections import Counter
 
-        paused_domains = []
         paused_prefixes = []
         for u in paused_urls:
-            try:
-                p = urlparse(u)
-                h = p.netloc.lower()
-                if h.startswith('www.'):
-                    h = h[4:]
-                paused_domains.append(h)
-                # construct prefix = host[/first_path_segment]
-                path = p.path or ""
-                seg = [s for s in path.split('/') if s]
-                if seg:
-                    pref = f"{h}/{seg[0]}"
-                else:
-                    pref = h
-                paused_prefixes.append(pref)
-            except Exception:
-                continue
+            # construct prefix = host[/first_path_segment]
+            h = canon_host(u)
+            seg = [s for s in urlsplit(u).path.split('/') if s]
+            if seg:
+                pref = f"{h}/{seg[0]}"
+            else:
+                pref = h
+            paused_prefixes.append(pref)
 
-        top_paused_domains = Counter(paused_domains).most_common(top_n)
         top_paused_prefixes = Counter(paused_prefixes).most_common(top_n)
 
         # domain distribution across all URLs
-        all_domains = []
         try:
-            with self.db.db_lock:
-                cur = self.db.conn.cursor()
-                cur.execute("SELECT url FROM urls")
-                rows = cur.fetchall()
-            for (u,) in rows:
-                try:
-                    p = urlparse(u)
-                    h = p.netloc.lower()
-                    if h.startswith('www.'):
-                        h = h[4:]
-                    all_domains.append(h)
-                except Exception:
-                    continue
+            domain_distribution = self.db.get_host_counts(top_n)
         except Exception:
-            all_domains = []
-
-        domain_distribution = Counter(all_domains).most_common(top_n)
+            domain_distribution = []
 
         return {
             "totals": {"total": total, "pending": pending, "visited": visited, "paused": paused, "error": error},
@@ -292,8 +397,8 @@ class Crawler:
         print()  # trailing blank line
 
     # Convenience helpers for startup / menus
-    def list_paused_urls(self):
-        return self.db.list_paused_urls()
+    def list_paused_urls(self, host: Optional[str] = None):
+        return self.db.list_paused_urls(canon_host(host) if host else None)
 
     def resume_all_paused(self) -> int:
         urls = self.db.resume_all_paused()
@@ -309,25 +414,16 @@ class Crawler:
         Resume only paused URLs whose host matches `domain` (exact or subdomain match).
         Returns the number resumed.
         """
-        resumed = 0
+        domain = canon_host(domain)
         try:
-            paused_urls = self.db.list_paused_urls()
-        except Exception:
-            paused_urls = []
-
-        for u in paused_urls:
-            try:
-                h = urlparse(u).netloc.lower()
-                if h.startswith("www."):
-                    h = h[4:]
-            except Exception:
-                continue
+            urls = self.db.resume_host(domain)
+        except Exception as e:
+            self.logger.error(f"Failed to resume paused URLs for domain {domain}: {e}")
+            urls = []
 
-            # match exact or subdomain
-            if h == domain or h.endswith("." + domain):
-                self.db.update_url_status(u, "pending", clear_pause_reason=True)
-                self.pending_queue.put(u)
-                resumed += 1
+        for u in urls:
+            self.pending_queue.put(u)
+        resumed = len(urls)
 
         if resumed:
             self.logger.info(f"Resumed {resumed} paused URL(s) for domain {domain}")
@@ -336,16 +432,48 @@ class Crawler:
         return resumed
 
     def start_workers(self) -> None:
+        cpus = worker_cpus()
         for i in range(self.num_workers):
-            t = threading.Thread(target=self._worker_loop, name=f"worker-{i+1}", daemon=True)
+            t = threading.Thread(target=self._worker_loop, args=(i,), name=f"worker-{i+1}", daemon=True)
             self.workers.append(t)
             t.start()
+            if cpus:
+                # Round-robin so each worker keeps its caches warm on one core
+                self._pin_thread(t, cpus[i % len(cpus)])
+        threading.Thread(target=self._json_flush_loop, name="json-flusher", daemon=True).start()
+        threading.Thread(target=self._retry_scheduler_loop, name="retry-scheduler", daemon=True).start()
+        if _env_flag(ADAPTIVE_WORKERS_ENV) and os.path.exists(PROC_STAT):
+            self._control_thread = threading.Thread(
+                target=self._control_loop, name="worker-control", daemon=True
+            )
+            self._control_thread.start()
         self.logger.info(f"Started {len(self.workers)} worker threads")
 
+    def _pin_thread(self, t: threading.Thread, cpu: int) -> None:
+        try:
+            os.sched_setaffinity(t.native_id, {cpu})
+        except OSError as e:
+            # The thread may already have exited, or the CPU is outside our cgroup
+            self.logger.warning(f"Could not pin {t.name} to CPU {cpu}: {e}")
+
     def stop(self) -> None:
         print("Stopping crawler... (workers will finish current tasks)")
         self.stop_event.set()
+        with self._retry_cond:
+            self._retry_cond.notify_all()
+        with self._park_cond:
+            self._park_cond.notify_all()
         # No need to join daemon threads strictly; they exit with main.
+        # Statuses are flushed before the JSONL file closes: once it is closed,
+        # a worker's save fails and its URL is retried rather than marked visited.
+        for worker_id in range(len(self._status_buffers)):
+            try:
+                self._flush_status_updates(worker_id)
+            except Exception as e:
+                self.logger.exception(f"Error flushing status updates on stop: {e}")
+        with self.json_lock:
+            self._json_fh.close()
+        self._save_seen_filter()
         self.db.close()
         self.logger.info("Stopping crawler and closing DB")
         print("State saved. Exiting.")
@@ -353,45 +481,68 @@ class Crawler:
     # ------------------------------------------------------------
     # Worker logic
     # ------------------------------------------------------------
-    def _worker_loop(self) -> None:
+    def _worker_loop(self, worker_id: int) -> None:
         session = requests.Session()
         session.headers.update({"User-Agent": USER_AGENT})
+        # Keep idle keep-alive connections for many hosts so TLS handshakes are reused
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_MAXSIZE,
+            max_retries=0,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
 
+        last_flush = time.monotonic()
         while not self.stop_event.is_set():
+            if worker_id >= self._active_worker_target:
+                self._park(worker_id)
+                last_flush = time.monotonic()
+                continue
+            buffered = len(self._status_buffers[worker_id])
             try:
-                url = self.pending_queue.get(timeout=1.0)
+                url = self.pending_queue.get(
+                    worker_id, timeout=STATUS_FLUSH_INTERVAL if buffered else 1.0
+                )
             except queue.Empty:
-                continue
+                url = None
 
-            try:
-                self._process_url_with_db_check(session, url)
-            except Exception as e:
-                # Catch-all to avoid killing the worker thread
-                self.logger.exception(f"Unexpected error in worker for {url}: {e}")
-            finally:
+            if url is not None:
                 try:
-                    self.pending_queue.task_done()
-                except Exception:
-                    pass
-
-    def _process_url_with_db_check(self, session: requests.Session, url: str) -> None:
-        row = self.db.get_url_row(url)
-        if not row:
-            # URL somehow removed; skip
-            return
-
-        status = row[2]
-        retry_count = row[5] if len(row) > 5 else 0
-        is_sitemap = row[6] if len(row) > 6 else 0
-
-        # Skip anything that is not pending
-        if status != "pending":
-            return
+                    update = self._process_url_with_db_check(session, url)
+                    if update is not None:
+                        with self._status_locks[worker_id]:
+                            if not self._status_buffers[worker_id]:
+                                last_flush = time.monotonic()
+                            self._status_buffers[worker_id].append(update)
+                except Exception as e:
+                    # Catch-all to avoid killing the worker thread
+                    self.logger.exception(f"Unexpected error in worker for {url}: {e}")
+
+            # Flush on batch size, on age of the oldest buffered update, or when idle
+            buffered = len(self._status_buffers[worker_id])
+            if buffered and (
+                url is None
+                or buffered >= STATUS_FLUSH_EVERY
+                or time.monotonic() - last_flush >= STATUS_FLUSH_INTERVAL
+            ):
+                try:
+                    self._flush_status_updates(worker_id)
+                except Exception as e:
+                    self.logger.exception(f"Error flushing status updates: {e}")
+                last_flush = time.monotonic()
 
-        # Respect pause commands that might have just come in
-        row_after = self.db.get_url_row(url)
-        if row_after and row_after[2] != "pending":
-            return
+    def _process_url_with_db_check(self, session: requests.Session, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim, fetch and process `url`. Returns the status update to record for it
+        (see CrawlerDB.flush_status_updates), or None if the URL was not claimed.
+        """
+        # Atomically flip pending -> in_progress; anything else (paused, visited,
+        # removed, or claimed by another worker) is skipped.
+        claimed = self.db.claim_pending(url)
+        if claimed is None:
+            return None
+        retry_count, is_sitemap = claimed
 
         # Crawl delay between requests per thread
         if self.delay_seconds > 0:
@@ -427,27 +578,96 @@ class Crawler:
             self.logger.warning(f"[{threading.current_thread().name}] Error fetching {url}: {error_msg}")
 
         if success:
-            self.db.update_url_status(url, "visited", last_error=None, is_sitemap=is_sitemap)
             self.logger.info(f"Visited: {url}")
-        else:
-            if retry_count + 1 < MAX_RETRIES:
-                # schedule another retry
-                self.db.update_url_status(
-                    url,
-                    "pending",
-                    last_error=error_msg,
-                    increment_retry=True,
-                )
-                self.pending_queue.put(url)
-                self.logger.info(f"Re-queued for retry: {url} (retry_count now +1)")
-            else:
-                self.db.update_url_status(
-                    url,
-                    "error",
-                    last_error=error_msg,
-                    increment_retry=True,
-                )
-                self.logger.error(f"Marked error after retries: {url} error={error_msg}")
+            return {"url": url, "status": "visited", "is_sitemap": is_sitemap}
+        if retry_count + 1 < MAX_RETRIES:
+            # back to pending; the retry is scheduled once this update is flushed
+            return {"url": url, "status": "pending", "last_error": error_msg, "retry_count": retry_count}
+        self.logger.error(f"Marked error after retries: {url} error={error_msg}")
+        return {"url": url, "status": "error", "last_error": error_msg}
+
+    def _flush_status_updates(self, worker_id: int) -> None:
+        """Write a worker's buffered status updates in one transaction, then schedule its retries."""
+        with self._status_locks[worker_id]:
+            updates = self._status_buffers[worker_id]
+            if not updates:
+                return
+            self._status_buffers[worker_id] = []
+            self.db.flush_status_updates(updates)
+
+        # Only re-queue after the row is pending again, or claim_pending would skip it
+        for update in updates:
+            if update["status"] == "pending":
+                backoff = self._schedule_retry(update["url"], update["retry_count"])
+                self.logger.info(f"Re-queued for retry in {backoff:.1f}s: {update['url']} (retry_count now +1)")
+
+    def _schedule_retry(self, url: str, retry_count: int) -> float:
+        """Queue `url` for another attempt after exponential backoff; returns the delay."""
+        backoff = min(RETRY_BACKOFF_MAX, 2 ** retry_count) + random.uniform(0, 1)
+        with self._retry_cond:
+            heapq.heappush(self._retry_heap, (time.time() + backoff, url))
+            self._retry_cond.notify()
+        return backoff
+
+    def _retry_scheduler_loop(self) -> None:
+        """Move retries whose backoff has expired into the pending queue."""
+        with self._retry_cond:
+            while not self.stop_event.is_set():
+                now = time.time()
+                while self._retry_heap and self._retry_heap[0][0] <= now:
+                    _, url = heapq.heappop(self._retry_heap)
+                    self.pending_queue.put(url)
+                timeout = self._retry_heap[0][0] - now if self._retry_heap else None
+                self._retry_cond.wait(timeout)
+
+    def _park(self, worker_id: int) -> None:
+        """Block an excess worker until the control loop raises the target again."""
+        # Don't sit on unwritten statuses; queued URLs get stolen by active peers
+        try:
+            self._flush_status_updates(worker_id)
+        except Exception as e:
+            self.logger.exception(f"Error flushing status updates: {e}")
+        with self._park_cond:
+            while worker_id >= self._active_worker_target and not self.stop_event.is_set():
+                self._park_cond.wait()
+
+    def _control_loop(self) -> None:
+        """
+        Every ADAPTIVE_INTERVAL, compare this process's CPU use with the whole
+        host's. Workers are only parked while the host is saturated *and* we use
+        more than our fair share of it, and never below the effective CPU count,
+        so an I/O-bound crawl next to a busy co-tenant keeps its concurrency.
+        """
+        ncpu = os.cpu_count() or 1
+        floor = min(self.num_workers, effective_cpu_count())
+        prev_self, prev_busy, prev_wall = _process_cpu_seconds(), _host_busy_seconds(), time.monotonic()
+        usage: Optional[float] = None
+        while not self.stop_event.wait(ADAPTIVE_INTERVAL):
+            cur_self, cur_busy, cur_wall = _process_cpu_seconds(), _host_busy_seconds(), time.monotonic()
+            if cur_busy is None or prev_busy is None:
+                return
+            d_self, d_busy, d_wall = cur_self - prev_self, cur_busy - prev_busy, cur_wall - prev_wall
+            prev_self, prev_busy, prev_wall = cur_self, cur_busy, cur_wall
+            if d_wall <= 0:
+                continue
+
+            sample = d_self / d_wall  # CPUs' worth of time used by this process
+            usage = sample if usage is None else usage + ADAPTIVE_SMOOTHING * (sample - usage)
+            target = next_worker_target(
+                self._active_worker_target,
+                usage=usage,
+                host_busy=max(0.0, d_busy) / (d_wall * ncpu),
+                host_cpus=ncpu,
+                floor=floor,
+                ceiling=self.num_workers,
+            )
+
+            if target != self._active_worker_target:
+                self.logger.info(f"Active worker target {self._active_worker_target} -> {target}")
+                with self._park_cond:
+                    self._active_worker_target = target
+                    self._park_cond.notify_all()
+
     # ------------------------------------------------------------
     # Content handling
     # ------------------------------------------------------------
@@ -460,18 +680,44 @@ class Crawler:
             return raw.decode("utf-8", errors="replace")
 
     def _handle_html_content(self, base_url: str, html: str) -> None:
-        soup = BeautifulSoup(html, "html.parser")
-
-        # Extract plain text (example: just print first 200 chars)
-        text = soup.get_text(separator=" ", strip=True)
-        snippet = text[:200].replace("\n", " ")
-        print(f"[CONTENT] {base_url} :: {len(text)} chars, snippet: {snippet!r}")
+        # A single walk over the tree collects every href plus just enough
+        # visible text for the snippet, instead of materializing the full text.
+        hrefs: List[str] = []
+        parts: List[str] = []
+        text_len = 0
+        if LexborHTMLParser is not None:
+            for node in LexborHTMLParser(html).root.traverse(include_text=True):
+                tag = node.tag
+                if tag == "a":
+                    href = node.attributes.get("href")
+                    if href:
+                        hrefs.append(href)
+                elif tag == "-text" and text_len < SNIPPET_CHARS:
+                    chunk = node.text_content.strip()
+                    if chunk and not has_non_text_ancestor(node):
+                        parts.append(chunk)
+                        text_len += len(chunk) + 1
+        else:
+            soup = BeautifulSoup(html, "html.parser")
+            for el in soup.descendants:
+                if isinstance(el, Tag):
+                    if el.name == "a" and el.get("href"):
+                        hrefs.append(el["href"])
+                elif text_len < SNIPPET_CHARS and type(el) is NavigableString:
+                    chunk = el.strip()
+                    if chunk and not any(p.name in NON_TEXT_TAGS for p in el.parents):
+                        parts.append(chunk)
+                        text_len += len(chunk) + 1
+
+        snippet = " ".join(parts)[:SNIPPET_CHARS].replace("\n", " ")
+        print(f"[CONTENT] {base_url} :: {len(html)} chars of HTML, {len(hrefs)} link(s), snippet: {snippet!r}")
 
         # Extract links
-        for a in soup.find_all("a", href=True):
-            href = a["href"]
+        rows = []
+        for href in hrefs:
+            if not href:
+                continue
             new_url = urljoin(base_url, href)
-            new_url, _ = urldefrag(new_url)  # drop fragments
             new_url = self._normalize_url(new_url)
             if not new_url:
                 continue
@@ -479,93 +725,305 @@ class Crawler:
             if not (new_url.startswith("http://") or new_url.startswith("https://")):
                 continue
 
-            self._enqueue_new_url(new_url)
+            rows.append((new_url, 0))
+
+        self._enqueue_new_urls(rows)
 
     def _handle_sitemap_content(self, url: str, raw_bytes: bytes) -> None:
-        # Decompress if gzip
-        if url.endswith(".gz"):
+        # Decompress gzip on the fly; the parser pulls from the stream directly.
+        # Bodies without the gzip magic (e.g. already decoded) are parsed as-is.
+        stream: IO[bytes] = io.BytesIO(raw_bytes)
+        head = raw_bytes[:SITEMAP_SNIFF_BYTES]
+        if url.endswith(".gz") and raw_bytes[:2] == b"\x1f\x8b":
+            stream = gzip.GzipFile(fileobj=stream)
             try:
-                with gzip.GzipFile(fileobj=io.BytesIO(raw_bytes)) as gz:
-                    raw_bytes = gz.read()
-            except OSError:
-                # not actually gzip, fall back to raw
-                pass
+                head = stream.peek(SITEMAP_SNIFF_BYTES)[:SITEMAP_SNIFF_BYTES]
+            except Exception as e:
+                print(f"[SITEMAP] Failed to parse {url}: {e}")
+                return
+
+        # Dispatch on the root element from the first bytes; other XML (feeds,
+        # API responses) is skipped without being parsed at all.
+        root_tag = self._sniff_xml_root(head)
+        if root_tag and not _local_name(root_tag).endswith(("sitemapindex", "urlset")):
+            print(f"[SITEMAP] Unrecognized XML root in {url}: {root_tag}")
+            return
 
         try:
-            text = raw_bytes.decode("utf-8", errors="replace")
-            root = ET.fromstring(text)
+            parsed_root, locs = self._parse_sitemap_locs(stream)
         except Exception as e:
             print(f"[SITEMAP] Failed to parse {url}: {e}")
             return
 
-        tag = root.tag.lower()
+        tag = (root_tag or parsed_root).lower()
         if tag.endswith("sitemapindex"):
             # sitemap index: contains <sitemap><loc>...</loc></sitemap>
-            loc_tag = self._tag_with_ns(root, "loc")
-            sitemap_tag = self._tag_with_ns(root, "sitemap")
-            for sm in root.findall(sitemap_tag):
-                loc_el = sm.find(loc_tag)
-                if loc_el is None or not loc_el.text:
-                    continue
-                sm_url = self._normalize_url(loc_el.text.strip())
+            rows = []
+            for loc in locs:
+                sm_url = self._normalize_url(loc)
                 if not sm_url:
                     continue
-                self._enqueue_new_url(sm_url, is_sitemap=1)
+                rows.append((sm_url, 1))
+            self._enqueue_new_urls(rows)
             print(f"[SITEMAP] Parsed sitemap index: {url}")
         elif tag.endswith("urlset"):
             # standard sitemap: contains <url><loc>...</loc></url>
-            url_tag = self._tag_with_ns(root, "url")
-            loc_tag = self._tag_with_ns(root, "loc")
-            count = 0
-            for u in root.findall(url_tag):
-                loc_el = u.find(loc_tag)
-                if loc_el is None or not loc_el.text:
-                    continue
-                page_url = self._normalize_url(loc_el.text.strip())
+            rows = []
+            for loc in locs:
+                page_url = self._normalize_url(loc)
                 if not page_url:
                     continue
-                self._enqueue_new_url(page_url)
-                count += 1
-            print(f"[SITEMAP] Parsed sitemap: {url} -> {count} URL(s)")
+                rows.append((page_url, 0))
+            self._enqueue_new_urls(rows)
+            print(f"[SITEMAP] Parsed sitemap: {url} -> {len(rows)} URL(s)")
         else:
-            print(f"[SITEMAP] Unrecognized XML root in {url}: {root.tag}")
+            print(f"[SITEMAP] Unrecognized XML root in {url}: {root_tag or parsed_root}")
 
-    def _tag_with_ns(self, root: ET.Element, local: str) -> str:
-        # Root tag may look like "{namespace}urlset"
-        if root.tag.startswith("{"):
-            ns = root.tag.split("}", 1)[0] + "}"
-            return ns + local
-        return local
+    def _sniff_xml_root(self, head: bytes) -> str:
+        """
+        Return the root element name found in the first bytes of an XML body,
+        or "" if it can't be told reliably (e.g. a comment precedes it).
+        """
+        if b"<!--" in head:
+            return ""
+        m = _XML_ROOT_RE.search(head)
+        if m is None or m.group(2) is None:
+            return ""
+        return m.group(1).decode("ascii", errors="replace")
+
+    def _parse_sitemap_locs(self, stream: IO[bytes]) -> Tuple[str, List[str]]:
+        """
+        Stream a sitemap and return (root tag, entry <loc> texts). Elements are
+        cleared as soon as they are read, so memory stays flat on 50k-URL files.
+        Only <loc> children of <url>/<sitemap> entries are collected (not e.g. image:loc).
+        """
+        locs: List[str] = []
+        if etree is not None:
+            context = etree.iterparse(
+                stream, events=("end",), tag="{*}loc", resolve_entities=False
+            )
+            for _, elem in context:
+                entry = elem.getparent()
+                if entry is not None and _local_name(entry.tag) in ("url", "sitemap"):
+                    if elem.text and elem.text.strip():
+                        locs.append(elem.text.strip())
+                    elem.clear()
+                    # drop already-processed entries from the root
+                    while entry.getprevious() is not None:
+                        del entry.getparent()[0]
+            root = context.root
+            return (root.tag if root is not None else ""), locs
+
+        # stdlib fallback: track depth so only root > entry > loc is collected
+        root = None
+        depth = 0
+        for event, elem in ET.iterparse(stream, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 2 and _local_name(elem.tag) == "loc":
+                if elem.text and elem.text.strip():
+                    locs.append(elem.text.strip())
+            elif depth == 1:
+                root.clear()  # finished a <url>/<sitemap> entry
+        return (root.tag if root is not None else ""), locs
 
     # ------------------------------------------------------------
     # URL helpers
     # ------------------------------------------------------------
     def _normalize_url(self, url: str) -> str:
+        """
+        Canonicalize http(s) URLs so trivially different spellings dedupe:
+        lowercase scheme/host, drop default ports, fragments and tracking params,
+        sort the query, and strip a trailing slash from query-less paths.
+        Anything else is returned stripped but otherwise unchanged.
+        """
         url = url.strip()
         if not url:
             return ""
-        # Basic normalization: remove trailing slash duplicates
-        if url.startswith("http://") or url.startswith("https://"):
-            # Further normalization could be added here
+        try:
+            parts = urlsplit(url)
+            port = parts.port
+        except ValueError:
             return url
-        return url
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https") or not parts.hostname:
+            return url
+
+        host = parts.hostname  # already lowercased
+        if ":" in host:
+            host = f"[{host}]"  # IPv6 literal
+        if port is not None and DEFAULT_PORTS[scheme] != port:
+            host = f"{host}:{port}"
+        if "@" in parts.netloc:
+            host = parts.netloc.rsplit("@", 1)[0] + "@" + host
+
+        query = ""
+        if parts.query:
+            # Raw pairs are kept byte-for-byte (no decode/re-encode round trip),
+            # so the canonical URL still fetches the same resource; only the
+            # key is decoded to test it against the tracking parameters.
+            pairs = []
+            for pair in parts.query.split("&"):
+                if not pair:
+                    continue
+                key = unquote_plus(pair.split("=", 1)[0]).lower()
+                if key.startswith("utm_") or key in TRACKING_PARAMS:
+                    continue
+                pairs.append(pair)
+            query = "&".join(sorted(pairs))
+
+        path = parts.path or "/"
+        if not query and len(path) > 1 and path.endswith("/"):
+            path = path.rstrip("/") or "/"
+
+        return urlunsplit((scheme, host, path, query, ""))
+
+    def _find_known_url(self, url: str) -> Tuple[str, Optional[Tuple]]:
+        """Look up a user-supplied URL as typed, then in canonical form."""
+        raw = url.strip()
+        row = self.db.get_url_row(raw)
+        if row:
+            return raw, row
+        url = self._normalize_url(raw)
+        return url, self.db.get_url_row(url)
 
     def _looks_like_sitemap(self, url: str) -> bool:
         lower = url.lower()
         return lower.endswith(".xml") or lower.endswith(".xml.gz") or "sitemap" in lower
 
-    def _enqueue_new_url(self, url: str, is_sitemap: int = 0) -> None:
-        inserted = self.db.insert_or_ignore_url(url, status="pending", is_sitemap=is_sitemap)
-        if inserted:
+    def _enqueue_new_urls(self, rows: List[Tuple[str, int]]) -> None:
+        """Insert discovered (url, is_sitemap) rows in one DB transaction and queue the new ones."""
+        # Lock-free membership test; only unseen URLs are sent to the DB
+        rows = [(u, sm) for u, sm in rows if u not in self._seen]
+        if not rows:
+            return
+        with self._seen_lock:
+            for u, _ in rows:
+                self._seen.add(u)
+        for url in self.db.insert_or_ignore_urls_bulk(rows):
             self.pending_queue.put(url)
             self.logger.info(f"Enqueued new URL: {url}")
 
 
-def determine_auto_threads() -> int:
+def _local_name(tag: str) -> str:
+    # "{namespace}loc" -> "loc"
+    return tag.rsplit("}", 1)[-1].lower()
+
+
+def _parse_cpu_list(spec: str) -> List[int]:
+    """Parse a CPU list like "0-3,8,10-11" (optionally in brackets) into sorted CPU ids."""
+    cpus = set()
+    for part in spec.strip().strip("[]").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return sorted(cpus)
+
+
+def worker_cpus() -> List[int]:
+    """
+    CPUs that worker threads are pinned to, or [] when pinning is unsupported
+    (non-Linux). CRAWLER_WORKER_AFFINITY narrows the set, e.g. to one NUMA node.
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        return []
+    allowed = os.sched_getaffinity(0)
+    spec = os.environ.get(WORKER_AFFINITY_ENV, "").strip()
+    if spec:
+        try:
+            requested = [c for c in _parse_cpu_list(spec) if c in allowed]
+        except ValueError:
+            requested = []
+        if requested:
+            return requested
+    return sorted(allowed)
+
+
+def _process_cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system
+
+
+def _host_busy_seconds() -> Optional[float]:
+    """Non-idle CPU seconds summed over all host CPUs, from the "cpu" line of /proc/stat."""
+    try:
+        with open(PROC_STAT) as fh:
+            fields = fh.readline().split()
+    except OSError:
+        return None
+    if not fields or fields[0] != "cpu":
+        return None
+    # user nice system idle iowait irq softirq steal ...; guest time is already in user
+    ticks = [int(x) for x in fields[1:9]]
+    busy = sum(ticks) - ticks[3] - ticks[4]
+    return busy / os.sysconf("SC_CLK_TCK")
+
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    """CPU quota from the cgroup (v2 cpu.max, else v1 CFS files), or None if unlimited."""
+    try:
+        with open(CGROUP_V2_CPU_MAX) as fh:
+            fields = fh.read().split()  # "<quota|max> <period>"
+        if not fields or fields[0] == "max":
+            return None
+        period = int(fields[1]) if len(fields) > 1 else 100000
+        return int(fields[0]) / period if period > 0 else None
+    except (OSError, ValueError):
+        pass
     try:
-        cpu = os.cpu_count() or 4
+        with open(CGROUP_V1_CFS_QUOTA) as fh:
+            quota_us = int(fh.read())
+        with open(CGROUP_V1_CFS_PERIOD) as fh:
+            period_us = int(fh.read())
+    except (OSError, ValueError):
+        return None
+    return quota_us / period_us if quota_us > 0 and period_us > 0 else None
+
+
+def next_worker_target(
+    target: int, usage: float, host_busy: float, host_cpus: int, floor: int, ceiling: int
+) -> int:
+    """
+    One step of the adaptive controller. `usage` is this process's CPU use in
+    CPUs, `host_busy` the host-wide busy fraction. Shrinks proportionally when
+    we exceed the upper hysteresis band of our fair share on a contended host,
+    grows by at most ADAPTIVE_GROWTH per step otherwise, and holds in between.
+    """
+    fair = host_cpus * ADAPTIVE_FAIR_SHARE
+    contended = host_busy >= ADAPTIVE_BUSY_THRESHOLD
+    if contended and usage > fair * (1 + ADAPTIVE_HYSTERESIS):
+        target = math.ceil(target * fair / usage)
+    elif not contended or usage < fair * (1 - ADAPTIVE_HYSTERESIS):
+        target = max(target + 1, math.ceil(target * ADAPTIVE_GROWTH))
+    return max(floor, min(ceiling, target))
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def effective_cpu_count() -> int:
+    """CPUs this process may actually use: the affinity mask, capped by any cgroup quota."""
+    try:
+        # Respects taskset/cgroup CPU sets, unlike os.cpu_count()
+        cpu = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 4
     except Exception:
         cpu = 4
-    # network-bound, allow more threads
-    return max(2, min(32, cpu * 4))
+    # Container CPU quotas (docker --cpus, k8s limits) don't show up in the affinity mask
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpu = max(1, min(cpu, math.ceil(limit)))
+    return cpu
+
+
+def determine_auto_threads() -> int:
+    cpu = effective_cpu_count()
+    # network-bound: size for concurrent connections, not cores
+    return max(2, min(AUTO_THREADS_MAX, cpu * 4))
 
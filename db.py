@@ -1,50 +1,168 @@
+import os
 import threading
 import sqlite3
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, Tuple, List
+from typing import Any, Dict, Iterator, Optional, Tuple, List
+from urllib.parse import quote
+
+from urlutils import canon_host
 
 
 DB_FILENAME = "crawler_state.db"
+# Max bound parameters per statement for batched IN (...) queries
+SQL_BATCH_SIZE = 500
+# Prepared statements kept per connection; chunked IN (...) queries add one per size
+SQL_STATEMENT_CACHE = 256
+# UPDATE ... RETURNING needs SQLite 3.35+
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def _prefix_bounds(prefix: str) -> Tuple[str, Optional[str]]:
+    """[low, high) string range covering every value that starts with `prefix`."""
+    # Bump the last character that has a successor; trailing max code points are dropped
+    stripped = prefix.rstrip(chr(0x10FFFF))
+    if not stripped:
+        return prefix, None
+    return prefix, stripped[:-1] + chr(ord(stripped[-1]) + 1)
+
+
+def _host_match_params(host: str) -> Tuple[str, int, str]:
+    """Parameters for "host = ? OR substr(host, -?) = ?": `host` itself or any subdomain."""
+    # A suffix comparison instead of LIKE, so "_" and "%" in `host` aren't wildcards
+    suffix = "." + host
+    return host, len(suffix), suffix
 
 
 class CrawlerDB:
     """
     Thread-safe SQLite wrapper for crawler state:
-    - URL statuses (pending/visited/paused/error)
+    - URL statuses (pending/in_progress/visited/paused/error)
     - Retry counts, error messages, sitemap flags
+
+    Writes go through a single connection guarded by `db_lock`; reads use a
+    read-only connection per thread so they never wait behind writers (WAL).
     """
 
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.db_lock = threading.Lock()
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.conn.execute("PRAGMA journal_mode=WAL;")
+        # Autocommit mode: transactions are opened explicitly where needed.
+        self._write_conn = sqlite3.connect(
+            self.db_path,
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=SQL_STATEMENT_CACHE,
+        )
+        self._apply_pragmas(self._write_conn)
+        self._read_local = threading.local()
+        self._read_conns: List[sqlite3.Connection] = []
+        self._read_conns_lock = threading.Lock()
         self._init_db()
 
     # ------------------------------------------------------------
     # Internal helpers
     # ------------------------------------------------------------
-    def _init_db(self) -> None:
+    def _apply_pragmas(self, conn: sqlite3.Connection, writer: bool = True) -> None:
+        # Set once per connection; connections live for the whole run.
+        if writer:
+            # WAL + synchronous=NORMAL only fsyncs on checkpoint, not on every commit.
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA busy_timeout=5000;")
+        conn.execute("PRAGMA cache_size=-20000;")  # ~20 MB page cache
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute("PRAGMA mmap_size=268435456;")  # 256 MB
+
+    def _reader(self) -> sqlite3.Connection:
+        """Return this thread's read-only connection, opening it on first use."""
+        conn = getattr(self._read_local, "conn", None)
+        if conn is None:
+            uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(
+                uri,
+                uri=True,
+                timeout=5.0,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=SQL_STATEMENT_CACHE,
+            )
+            # journal_mode is a property of the DB file, already WAL via the writer
+            self._apply_pragmas(conn, writer=False)
+            self._read_local.conn = conn
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+        return conn
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Cursor]:
+        """Run a block inside a BEGIN IMMEDIATE transaction on the write connection."""
         with self.db_lock:
-            cur = self.conn.cursor()
+            cur = self._write_conn.cursor()
+            # IMMEDIATE takes the write lock up front, so a write never has to
+            # upgrade a read snapshot (the SQLITE_BUSY_SNAPSHOT deadlock case).
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+                cur.execute("COMMIT")
+            except BaseException:
+                # SQLite may already have rolled back on its own (e.g. SQLITE_FULL)
+                if self._write_conn.in_transaction:
+                    cur.execute("ROLLBACK")
+                raise
+
+    def _init_db(self) -> None:
+        with self._write() as cur:
             cur.execute(
                 """
                 CREATE TABLE IF NOT EXISTS urls (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     url TEXT NOT NULL UNIQUE,
-                    status TEXT NOT NULL, -- pending, visited, paused, error
+                    status TEXT NOT NULL, -- pending, in_progress, visited, paused, error
                     last_status_change TEXT,
                     last_error TEXT,
                     retry_count INTEGER DEFAULT 0,
                     is_sitemap INTEGER DEFAULT 0,
-                    pause_reason TEXT
+                    pause_reason TEXT,
+                    host TEXT -- canon_host(url), for per-domain queries
                 )
                 """
             )
+            cur.execute("PRAGMA table_info(urls)")
+            needs_host = "host" not in {row[1] for row in cur.fetchall()}
+            # idx_urls_status_url (status, url) below covers status-only lookups too
+            cur.execute("DROP INDEX IF EXISTS idx_urls_status")
+            # Partial index stays small even when most rows are visited
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS idx_urls_pending ON urls (id) WHERE status = 'pending'"
+            )
+            # Never chosen by the planner over the status indexes; only cost writes
+            cur.execute("DROP INDEX IF EXISTS idx_urls_paused")
+            # Range scans over URLs of one status (e.g. pending-by-prefix)
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS idx_urls_status_url ON urls (status, url)"
+            )
+            if needs_host:
+                self._add_host_column(cur)
+            # (host, status) also serves host-only lookups; it replaces idx_urls_host
+            cur.execute("DROP INDEX IF EXISTS idx_urls_host")
             cur.execute(
-                "CREATE INDEX IF NOT EXISTS idx_urls_status ON urls (status)"
+                "CREATE INDEX IF NOT EXISTS idx_urls_host_status ON urls (host, status)"
             )
-            self.conn.commit()
+            # Rows claimed by a worker of a previous run that never finished
+            cur.execute(
+                "UPDATE urls SET status = 'pending' WHERE status = 'in_progress'"
+            )
+
+    def _add_host_column(self, cur: sqlite3.Cursor) -> None:
+        # Migrate DBs created before the host column existed
+        cur.execute("ALTER TABLE urls ADD COLUMN host TEXT")
+        cur.execute("SELECT id, url FROM urls")
+        cur.executemany(
+            "UPDATE urls SET host = ? WHERE id = ?",
+            [(canon_host(url), row_id) for row_id, url in cur.fetchall()],
+        )
 
     def _now(self) -> str:
         return datetime.utcnow().isoformat(timespec="seconds")
@@ -53,16 +171,14 @@ class CrawlerDB:
     # Public DB operations
     # ------------------------------------------------------------
     def get_url_row(self, url: str) -> Optional[Tuple]:
-        with self.db_lock:
-            cur = self.conn.cursor()
-            cur.execute("SELECT * FROM urls WHERE url = ?", (url,))
-            return cur.fetchone()
+        cur = self._reader().cursor()
+        cur.execute("SELECT * FROM urls WHERE url = ?", (url,))
+        return cur.fetchone()
 
     def get_earliest_url(self) -> Optional[str]:
-        with self.db_lock:
-            cur = self.conn.cursor()
-            cur.execute("SELECT url FROM urls ORDER BY id ASC LIMIT 1")
-            row = cur.fetchone()
+        cur = self._reader().cursor()
+        cur.execute("SELECT url FROM urls ORDER BY id ASC LIMIT 1")
+        row = cur.fetchone()
         if row:
             return row[0]
         return None
@@ -74,20 +190,76 @@ class CrawlerDB:
         Insert URL if not present. Returns True if inserted, False if duplicate.
         """
         now = self._now()
-        with self.db_lock:
-            cur = self.conn.cursor()
-            try:
+        with self._write() as cur:
+            cur.execute(
+                """
+                INSERT OR IGNORE INTO urls (url, status, last_status_change, retry_count, is_sitemap, host)
+                VALUES (?, ?, ?, 0, ?, ?)
+                """,
+                (url, status, now, is_sitemap, canon_host(url)),
+            )
+            return cur.rowcount == 1
+
+    def insert_or_ignore_urls_bulk(self, rows: List[Tuple[str, int]]) -> List[str]:
+        """
+        Insert many (url, is_sitemap) rows as pending in a single transaction.
+        Returns the URLs that were newly inserted, in input order.
+        """
+        if not rows:
+            return []
+        now = self._now()
+        new_rows: List[Tuple[str, int]] = []
+        with self._write() as cur:
+            # Drop duplicates within the batch and anything already in the DB
+            unique = dict(rows)
+            urls = list(unique)
+            known = set()
+            for i in range(0, len(urls), SQL_BATCH_SIZE):
+                chunk = urls[i:i + SQL_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                cur.execute(f"SELECT url FROM urls WHERE url IN ({placeholders})", chunk)
+                known.update(url for (url,) in cur.fetchall())
+            new_rows = [(u, sm) for u, sm in unique.items() if u not in known]
+            cur.executemany(
+                """
+                INSERT OR IGNORE INTO urls (url, status, last_status_change, retry_count, is_sitemap, host)
+                VALUES (?, 'pending', ?, 0, ?, ?)
+                """,
+                [(u, now, sm, canon_host(u)) for u, sm in new_rows],
+            )
+        return [u for u, _ in new_rows]
+
+    def claim_pending(self, url: str) -> Optional[Tuple[int, int]]:
+        """
+        Mark a pending URL as in_progress. Returns (retry_count, is_sitemap) if
+        this call claimed it, or None if the URL is missing or not pending.
+        """
+        now = self._now()
+        with self._write() as cur:
+            if HAS_RETURNING:
                 cur.execute(
                     """
-                    INSERT INTO urls (url, status, last_status_change, retry_count, is_sitemap)
-                    VALUES (?, ?, ?, 0, ?)
+                    UPDATE urls SET status = 'in_progress', last_status_change = ?
+                    WHERE url = ? AND status = 'pending'
+                    RETURNING retry_count, is_sitemap
                     """,
-                    (url, status, now, is_sitemap),
+                    (now, url),
                 )
-                self.conn.commit()
-                return True
-            except sqlite3.IntegrityError:
-                return False
+                row = cur.fetchone()
+            else:
+                cur.execute(
+                    "SELECT retry_count, is_sitemap FROM urls WHERE url = ? AND status = 'pending'",
+                    (url,),
+                )
+                row = cur.fetchone()
+                if row is not None:
+                    cur.execute(
+                        "UPDATE urls SET status = 'in_progress', last_status_change = ? WHERE url = ?",
+                        (now, url),
+                    )
+        if row is None:
+            return None
+        return int(row[0] or 0), int(row[1] or 0)
 
     def update_url_status(
         self,
@@ -100,9 +272,7 @@ class CrawlerDB:
         increment_retry: bool = False,
     ) -> None:
         now = self._now()
-        with self.db_lock:
-            cur = self.conn.cursor()
-
+        with self._write() as cur:
             fields = ["status = ?", "last_status_change = ?"]
             params: List = [status, now]
 
@@ -126,36 +296,114 @@ class CrawlerDB:
             params.append(url)
             query = f"UPDATE urls SET {', '.join(fields)} WHERE url = ?"
             cur.execute(query, tuple(params))
-            self.conn.commit()
+
+    def flush_status_updates(self, updates: List[Dict[str, Any]]) -> None:
+        """
+        Apply a batch of worker status updates in one transaction. Each update is
+        a dict with "url" and "status", where status is one of:
+        - "visited": also sets is_sitemap
+        - "pending": a failed fetch to retry; sets last_error, bumps retry_count
+        - "error": retries exhausted; sets last_error, bumps retry_count
+        """
+        now = self._now()
+        visited = [(now, u.get("is_sitemap", 0), u["url"]) for u in updates if u["status"] == "visited"]
+        failed = [
+            (u["status"], now, u.get("last_error"), u["url"])
+            for u in updates
+            if u["status"] in ("pending", "error")
+        ]
+        with self._write() as cur:
+            cur.executemany(
+                """
+                UPDATE urls
+                SET status = 'visited', last_status_change = ?, is_sitemap = ?
+                WHERE url = ?
+                """,
+                visited,
+            )
+            cur.executemany(
+                """
+                UPDATE urls
+                SET status = ?, last_status_change = ?, last_error = ?,
+                    retry_count = retry_count + 1
+                WHERE url = ?
+                """,
+                failed,
+            )
 
     def load_pending_urls(self) -> List[str]:
-        with self.db_lock:
-            cur = self.conn.cursor()
-            cur.execute("SELECT url FROM urls WHERE status = 'pending'")
-            rows = cur.fetchall()
+        cur = self._reader().cursor()
+        cur.execute(
+            "SELECT url FROM urls INDEXED BY idx_urls_pending WHERE status = 'pending'"
+        )
+        rows = cur.fetchall()
         return [url for (url,) in rows]
 
-    def get_status_counts(self) -> Tuple[int, int, int, int]:
-        with self.db_lock:
-            cur = self.conn.cursor()
+    def find_urls_by_prefix(self, status: str, prefix: str, limit: int) -> Tuple[int, List[str]]:
+        """
+        Return (match_count, first `limit` URLs in url order) for URLs with
+        `status` that start with `prefix` (case-sensitive).
+        """
+        low, high = _prefix_bounds(prefix)
+        cur = self._reader().cursor()
+        # url >= low AND url < high is a seek on idx_urls_status_url, unlike LIKE
+        where = "status = ? AND url >= ?" + (" AND url < ?" if high is not None else "")
+        params: Tuple = (status, low) if high is None else (status, low, high)
+        cur.execute(f"SELECT COUNT(*) FROM urls WHERE {where}", params)
+        count = int(cur.fetchone()[0])
+        cur.execute(f"SELECT url FROM urls WHERE {where} ORDER BY url LIMIT ?", params + (limit,))
+        return count, [url for (url,) in cur.fetchall()]
+
+    def iter_all_urls(self) -> Iterator[str]:
+        """Yield every known URL without materializing the whole table."""
+        cur = self._reader().cursor()
+        cur.execute("SELECT url FROM urls")
+        for (url,) in cur:
+            yield url
+
+    def count_urls(self) -> int:
+        cur = self._reader().cursor()
+        cur.execute("SELECT COUNT(*) FROM urls")
+        return int(cur.fetchone()[0])
+
+    def get_host_counts(self, top_n: int, status: Optional[str] = None) -> List[Tuple[str, int]]:
+        """Return the `top_n` (host, url_count) pairs, most URLs first, optionally for one status."""
+        cur = self._reader().cursor()
+        if status is None:
+            cur.execute(
+                "SELECT host, COUNT(*) AS c FROM urls GROUP BY host ORDER BY c DESC LIMIT ?",
+                (top_n,),
+            )
+        else:
             cur.execute(
                 """
-                SELECT
-                    SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END),
-                    SUM(CASE WHEN status = 'visited' THEN 1 ELSE 0 END),
-                    SUM(CASE WHEN status = 'paused' THEN 1 ELSE 0 END),
-                    SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END)
-                FROM urls
-                """
+                SELECT host, COUNT(*) AS c FROM urls
+                WHERE status = ?
+                GROUP BY host ORDER BY c DESC LIMIT ?
+                """,
+                (status, top_n),
             )
-            row = cur.fetchone()
+        return [(host, int(c)) for host, c in cur.fetchall()]
+
+    def get_status_counts(self) -> Tuple[int, int, int, int]:
+        cur = self._reader().cursor()
+        cur.execute(
+            """
+            SELECT
+                SUM(CASE WHEN status IN ('pending', 'in_progress') THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'visited' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'paused' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END)
+            FROM urls
+            """
+        )
+        row = cur.fetchone()
         if row is None:
             return 0, 0, 0, 0
         return tuple(int(x or 0) for x in row)  # type: ignore[return-value]
 
     def pause_prefix(self, prefix: str, reason: str) -> int:
-        with self.db_lock:
-            cur = self.conn.cursor()
+        with self._write() as cur:
             cur.execute(
                 """
                 UPDATE urls
@@ -167,24 +415,32 @@ class CrawlerDB:
                 (self._now(), reason, f"{prefix}%"),
             )
             affected = cur.rowcount
-            self.conn.commit()
         return affected
 
-    def list_paused_urls(self) -> List[str]:
-        with self.db_lock:
-            cur = self.conn.cursor()
+    def list_paused_urls(self, host: Optional[str] = None) -> List[str]:
+        """Paused URLs in insertion order, optionally only those on `host` or its subdomains."""
+        cur = self._reader().cursor()
+        if host is None:
             cur.execute(
                 "SELECT url FROM urls WHERE status = 'paused' ORDER BY id ASC"
             )
-            rows = cur.fetchall()
+        else:
+            cur.execute(
+                """
+                SELECT url FROM urls
+                WHERE status = 'paused' AND (host = ? OR substr(host, -?) = ?)
+                ORDER BY id ASC
+                """,
+                _host_match_params(host),
+            )
+        rows = cur.fetchall()
         return [row[0] for row in rows]
 
     def resume_all_paused(self) -> List[str]:
         """
         Set all paused URLs back to pending and return the list of affected URLs.
         """
-        with self.db_lock:
-            cur = self.conn.cursor()
+        with self._write() as cur:
             cur.execute(
                 "SELECT url FROM urls WHERE status = 'paused'"
             )
@@ -200,13 +456,11 @@ class CrawlerDB:
                 """,
                 (self._now(),),
             )
-            self.conn.commit()
 
         return urls
 
     def resume_prefix(self, prefix: str):
-        with self.db_lock:
-            cur = self.conn.cursor()
+        with self._write() as cur:
             cur.execute(
                 """
                 SELECT url FROM urls
@@ -227,13 +481,69 @@ class CrawlerDB:
                 (self._now(), f"{prefix}%",),
             )
             affected = cur.rowcount
-            self.conn.commit()
 
         return urls, affected
 
+    def resume_urls(self, urls: List[str]) -> List[str]:
+        """
+        Set the given URLs back to pending if they are paused, in one transaction.
+        Returns the URLs that were actually resumed.
+        """
+        urls = list(dict.fromkeys(urls))
+        with self._write() as cur:
+            paused: List[str] = []
+            for i in range(0, len(urls), SQL_BATCH_SIZE):
+                chunk = urls[i:i + SQL_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                cur.execute(
+                    f"SELECT url FROM urls WHERE status = 'paused' AND url IN ({placeholders})",
+                    chunk,
+                )
+                paused.extend(url for (url,) in cur.fetchall())
+
+            now = self._now()
+            cur.executemany(
+                """
+                UPDATE urls
+                SET status = 'pending',
+                    last_status_change = ?,
+                    pause_reason = NULL
+                WHERE url = ?
+                """,
+                [(now, u) for u in paused],
+            )
+        return paused
+
+    def resume_host(self, host: str) -> List[str]:
+        """Resume every paused URL on `host` or its subdomains; returns the resumed URLs."""
+        with self._write() as cur:
+            cur.execute(
+                """
+                SELECT url FROM urls
+                WHERE status = 'paused' AND (host = ? OR substr(host, -?) = ?)
+                """,
+                _host_match_params(host),
+            )
+            urls = [row[0] for row in cur.fetchall()]
+
+            cur.execute(
+                """
+                UPDATE urls
+                SET status = 'pending',
+                    last_status_change = ?,
+                    pause_reason = NULL
+                WHERE status = 'paused' AND (host = ? OR substr(host, -?) = ?)
+                """,
+                (self._now(),) + _host_match_params(host),
+            )
+        return urls
+
     def close(self) -> None:
+        with self._read_conns_lock:
+            for conn in self._read_conns:
+                conn.close()
+            self._read_conns.clear()
         with self.db_lock:
-            self.conn.commit()
-            self.conn.close()
+            self._write_conn.close()
 
 
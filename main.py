@@ -1,8 +1,264 @@
+import contextlib
+import math
 import os
-from urllib.parse import urlparse
+import sys
+from typing import Callable, List, Optional, TypeVar
+
+try:
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.patch_stdout import patch_stdout
+except ImportError:  # optional; fall back to plain input()
+    PromptSession = None
 
 from crawler import Crawler, determine_auto_threads
 from db import DB_FILENAME
+from urlutils import canon_host
+
+
+HELP_TEXT = (
+    "Commands:\n"
+    "  seed <url>            - add a new seed URL (page or sitemap)\n"
+    "  pause <url>           - pause a single URL\n"
+    "  pause-prefix <prefix> - pause all pending URLs with given prefix\n"
+    "  resume <url>          - resume a paused URL\n"
+    "  resume-prefix <prefix>- resume paused URLs with prefix\n"
+    "  stats                 - show crawler statistics and top paused domains\n"
+    "  status                - show worker & URL counts\n"
+    "  stop / quit           - save state and exit\n"
+    "  help                  - show this help\n"
+)
+
+# Command loop: name -> (handler(crawler, arg), usage if an argument is required)
+_COMMANDS = {
+    "seed": (lambda c, a: c.add_seed_url(a), "seed <url>"),
+    "pause": (lambda c, a: c.pause_url(a), "pause <url>"),
+    "pause-prefix": (lambda c, a: c.pause_prefix(a), "pause-prefix <prefix>"),
+    "resume": (lambda c, a: c.resume_url(a), "resume <url>"),
+    "resume-prefix": (lambda c, a: c.resume_prefix(a), "resume-prefix <prefix>"),
+    "stats": (lambda c, _: c.print_stats(), None),
+    "status": (lambda c, _: c.print_status(), None),
+    "help": (lambda c, _: print(HELP_TEXT), None),
+}
+_QUIT_COMMANDS = frozenset({"quit", "stop", "exit"})
+
+T = TypeVar("T", int, float)
+
+
+# Startup menu handlers return _STARTED once workers run, _EXIT to quit, or
+# None to show the menu again.
+_STARTED = "started"
+_EXIT = "exit"
+
+
+def _start(crawler: Crawler) -> str:
+    crawler.start_workers()
+    print("Crawler started. Type 'help' for commands.")
+    return _STARTED
+
+
+def _read_seed_lines() -> List[str]:
+    """Read seed URLs (or files of URLs, one per line) until a blank line."""
+    seeds: List[str] = []
+    prompt = "Enter seed URL(s) or a file of URLs, one per line (blank line to finish): "
+    while True:
+        line = input(prompt).strip()
+        if not line:
+            return seeds
+        prompt = "... "
+        if os.path.isfile(line):
+            try:
+                with open(line, encoding="utf-8") as fh:
+                    file_seeds = [
+                        u for u in (l.strip() for l in fh) if u and not u.startswith("#")
+                    ]
+            except (OSError, UnicodeDecodeError) as e:
+                # Skip the whole file rather than seed part of it
+                print(f"Could not read seed file {line!r}: {e}")
+                continue
+            seeds.extend(file_seeds)
+        else:
+            seeds.append(line)
+
+
+def _menu_add_seed(crawler: Crawler, pending: int) -> Optional[str]:
+    # Add seed URL(s), then return to menu
+    seeds = _read_seed_lines()
+    if len(seeds) == 1:
+        crawler.add_seed_url(seeds[0])
+    elif seeds:
+        # One transaction for the whole batch
+        crawler.add_seed_urls(seeds)
+    return None
+
+
+def _menu_resume_all(crawler: Crawler, pending: int) -> Optional[str]:
+    # Resume paused URLs (only for main domain if detected)
+    if getattr(crawler, 'main_domain', None):
+        print(f"Resuming paused URLs for main domain: {crawler.main_domain}")
+        resumed = crawler.resume_paused_for_domain(crawler.main_domain)
+    else:
+        resumed = crawler.resume_all_paused()
+    if pending == 0 and resumed == 0:
+        confirm = input(
+            "There are currently no pending or paused URLs. Start anyway? (y/N): "
+        ).strip().lower()
+        if confirm != "y":
+            return None
+    return _start(crawler)
+
+
+def _menu_resume_specific(crawler: Crawler, pending: int) -> Optional[str]:
+    print("Note: 'Resume specific' will only resume URLs with status 'paused'. Pending URLs are already queued.")
+
+    # Ensure we have a main domain to filter by. Try crawler.main_domain first,
+    # then try to infer from DB earliest URL, otherwise prompt the user.
+    md = getattr(crawler, 'main_domain', None)
+    if not md:
+        try:
+            first = crawler.db.get_earliest_url()
+            if first:
+                md = canon_host(first)
+                crawler.main_domain = md
+                print(f"Inferred main domain from DB: {md}")
+        except Exception:
+            md = None
+
+    if not md:
+        ans = input("No main domain detected. Enter main domain to filter, or leave blank to show all paused: ").strip()
+        if ans:
+            md = canon_host(ans)
+            crawler.main_domain = md
+
+    # The host filter runs in SQLite (host column + (host, status) index)
+    try:
+        paused_urls = crawler.list_paused_urls(host=md) if md else []
+        if paused_urls:
+            print(f"(Showing paused URLs for main domain: {md})")
+        else:
+            paused_urls = crawler.list_paused_urls()
+            if md and paused_urls:
+                # No paused URLs for main domain — automatically show all paused URLs
+                # so the user can resume items they paused on other domains.
+                print("(No paused URLs for main domain; showing ALL paused URLs)")
+    except Exception as e:
+        print(f"Error retrieving paused URLs: {e}")
+        return None
+
+    if not paused_urls:
+        print("\nThere are no paused URLs to resume.")
+        print()  # Add blank line for clarity
+        return None
+
+    print(f"\nFound {len(paused_urls)} paused URL(s):")
+    print("Paused URLs:")
+    for idx, url in enumerate(paused_urls, start=1):
+        print(f"  {idx}) {url}")
+    print()  # Add blank line before prompt
+
+    sel = input(
+        "\nEnter number(s) to resume (comma-separated, or 'all' to resume all): "
+    ).strip().lower()
+
+    # Selected URLs are resumed together in one DB transaction
+    if sel == "all":
+        selected = paused_urls
+    else:
+        parts = [p.strip() for p in sel.split(",") if p.strip()]
+        if not parts:
+            print("No valid selection entered. Returning to menu.")
+            return None
+        selected = []
+        for p in parts:
+            if not p.isdigit():
+                print(f"Skipping invalid selection: {p!r}")
+                continue
+            i = int(p)
+            if 1 <= i <= len(paused_urls):
+                selected.append(paused_urls[i - 1])
+            else:
+                print(f"Index out of range: {i}")
+
+    resumed_count = crawler.resume_urls(selected) if selected else 0
+    if resumed_count > 0 or sel == "all":
+        print(f"\nResumed {resumed_count} URL(s).")
+
+    if resumed_count > 0:
+        return _start(crawler)
+    print("No URLs were resumed. Returning to menu.")
+    return None
+
+
+def _menu_pause_url(crawler: Crawler, pending: int) -> Optional[str]:
+    url_to_pause = input("Enter URL to pause (leave blank to cancel): ").strip()
+    if url_to_pause:
+        crawler.pause_url(url_to_pause)
+        print()  # Add blank line for clarity
+    return None
+
+
+def _menu_list_pending(crawler: Crawler, pending: int) -> Optional[str]:
+    prefix = input("Enter URL prefix to list pending (leave blank to cancel): ").strip()
+    if prefix:
+        # Show a few examples and count (index range scan, not a full load)
+        try:
+            count, pending_urls = crawler.db.find_urls_by_prefix("pending", prefix, 20)
+        except Exception:
+            count, pending_urls = 0, []
+        print(f"Found {count} pending URL(s) with prefix {prefix!r}:")
+        for u in pending_urls:
+            print(f"  {u}")
+        if count > len(pending_urls):
+            print("  ... (truncated)")
+        print()
+    return None
+
+
+def _menu_pause_prefix(crawler: Crawler, pending: int) -> Optional[str]:
+    prefix = input("Enter URL prefix to pause (leave blank to cancel): ").strip()
+    if prefix:
+        crawler.pause_prefix(prefix)
+        print()  # blank line
+    return None
+
+
+def _menu_stats(crawler: Crawler, pending: int) -> Optional[str]:
+    crawler.print_stats()
+    return None
+
+
+def _menu_exit(crawler: Crawler, pending: int) -> Optional[str]:
+    print("Exiting without starting crawler.")
+    return _EXIT
+
+
+_MENU = {
+    "1": _menu_add_seed,
+    "2": _menu_resume_all,
+    "3": _menu_resume_specific,
+    "4": _menu_pause_url,
+    "5": _menu_list_pending,
+    "6": _menu_pause_prefix,
+    "7": _menu_stats,
+    "8": _menu_exit,
+}
+
+
+def _prompt_nonneg(prompt: str, caster: Callable[[str], T], default: T) -> T:
+    """Ask until the answer is blank (-> `default`) or a finite, non-negative `caster` value."""
+    kind = "number" if caster is float else "integer"
+    while True:
+        raw = input(prompt).strip()
+        if not raw:
+            return default
+        try:
+            value = caster(raw)
+        except ValueError:
+            value = None
+        # float() happily accepts "nan" and "inf"; ints are always finite, and
+        # math.isfinite() overflows on huge ones
+        if value is not None and value >= 0 and (caster is not float or math.isfinite(value)):
+            return value
+        print(f"Please enter a non-negative {kind}.")
 
 
 def main() -> None:
@@ -12,36 +268,16 @@ def main() -> None:
     print("=== Terminal Web Crawler ===")
 
     # Crawl delay
-    while True:
-        delay_input = input("Crawl delay between requests (seconds, default 1.0): ").strip()
-        if not delay_input:
-            delay = 1.0
-            break
-        try:
-            delay = float(delay_input)
-            if delay < 0:
-                raise ValueError
-            break
-        except ValueError:
-            print("Please enter a non-negative number.")
+    delay = _prompt_nonneg(
+        "Crawl delay between requests (seconds, default 1.0): ", float, 1.0
+    )
 
     # Worker count
     auto_threads = determine_auto_threads()
-    while True:
-        th_input = input(
-            f"Number of worker threads (0 = auto [{auto_threads}]): "
-        ).strip()
-        if not th_input:
-            num_workers = auto_threads
-            break
-        try:
-            n = int(th_input)
-            if n < 0:
-                raise ValueError
-            num_workers = auto_threads if n == 0 else max(1, n)
-            break
-        except ValueError:
-            print("Please enter a non-negative integer.")
+    n = _prompt_nonneg(
+        f"Number of worker threads (0 = auto [{auto_threads}]): ", int, 0
+    )
+    num_workers = auto_threads if n == 0 else n
 
     crawler = Crawler(db_path=db_path, num_workers=num_workers, delay_seconds=delay)
 
@@ -65,238 +301,54 @@ def main() -> None:
         )
         choice = input("Select an option (1-8): ").strip()
 
-        if choice == "1":
-            # Add a single seed URL, then return to menu
-            seed = input("Enter seed URL (leave blank to cancel): ").strip()
-            if seed:
-                crawler.add_seed_url(seed)
-            # Loop back to show updated counts and options again
-        elif choice == "2":
-            # Resume paused URLs (only for main domain if detected)
-            if getattr(crawler, 'main_domain', None):
-                print(f"Resuming paused URLs for main domain: {crawler.main_domain}")
-                resumed = crawler.resume_paused_for_domain(crawler.main_domain)
-            else:
-                resumed = crawler.resume_all_paused()
-            if pending == 0 and resumed == 0:
-                confirm = input(
-                    "There are currently no pending or paused URLs. Start anyway? (y/N): "
-                ).strip().lower()
-                if confirm != "y":
-                    continue
-            crawler.start_workers()
-            print("Crawler started. Type 'help' for commands.")
+        action = _MENU.get(choice)
+        if action is None:
+            print(f"Invalid option, please choose a number between 1 and {len(_MENU)}.")
+            continue
+        outcome = action(crawler, pending)
+        if outcome == _EXIT:
+            return
+        if outcome == _STARTED:
             break
-        elif choice == "3":
-            print("Note: 'Resume specific' will only resume URLs with status 'paused'. Pending URLs are already queued.")
 
-            # Ensure we have a main domain to filter by. Try crawler.main_domain first,
-            # then try to infer from DB earliest URL, otherwise prompt the user.
-            md = getattr(crawler, 'main_domain', None)
-            if not md:
-                try:
-                    first = crawler.db.get_earliest_url()
-                    if first:
-                        p = urlparse(first)
-                        host = p.netloc.lower()
-                        if host.startswith('www.'):
-                            host = host[4:]
-                        md = host
-                        crawler.main_domain = md
-                        print(f"Inferred main domain from DB: {md}")
-                except Exception:
-                    md = None
-
-            if not md:
-                ans = input("No main domain detected. Enter main domain to filter, or leave blank to show all paused: ").strip()
-                if ans:
-                    md = ans.lower()
-                    if md.startswith('www.'):
-                        md = md[4:]
-                    crawler.main_domain = md
-
-            try:
-                all_paused = crawler.list_paused_urls()
-            except Exception as e:
-                print(f"Error retrieving paused URLs: {e}")
-                continue
-
-            paused_urls = all_paused
-
-            # If we have a main_domain, filter paused URLs to that domain for display
-            if md:
-                filtered = []
-                for u in all_paused:
-                    try:
-                        h = urlparse(u).netloc.lower()
-                        if h.startswith('www.'):
-                            h = h[4:]
-                    except Exception:
-                        continue
-                    if h == md or h.endswith('.' + md):
-                        filtered.append(u)
-                if filtered:
-                    paused_urls = filtered
-                    print(f"(Showing paused URLs for main domain: {md})")
-                else:
-                    # No paused URLs for main domain — automatically show all paused URLs
-                    # so the user can resume items they paused on other domains.
-                    if all_paused:
-                        paused_urls = all_paused
-                        print("(No paused URLs for main domain; showing ALL paused URLs)")
-                    else:
-                        print("\nThere are no paused URLs to resume.")
-                        print()
-                        continue
-
-            if not paused_urls:
-                print("\nThere are no paused URLs to resume.")
-                print()  # Add blank line for clarity
-                continue
+    # Command loop (runs after workers have started). With prompt_toolkit,
+    # worker output is printed above the prompt instead of over what is typed.
+    if PromptSession is not None and sys.stdin.isatty():
+        session = PromptSession()
+        read_command = lambda: session.prompt("> ")
+        output_guard = patch_stdout()
+    else:
+        read_command = lambda: input("> ")
+        output_guard = contextlib.nullcontext()
 
-            print(f"\nFound {len(paused_urls)} paused URL(s):")
-            print("Paused URLs:")
-            for idx, url in enumerate(paused_urls, start=1):
-                print(f"  {idx}) {url}")
-            print()  # Add blank line before prompt
-
-            sel = input(
-                "\nEnter number(s) to resume (comma-separated, or 'all' to resume all): "
-            ).strip().lower()
-
-            resumed_count = 0
-            if sel == "all":
-                for url in paused_urls:
-                    crawler.resume_url(url)
-                    resumed_count += 1
-                print(f"\nResumed {resumed_count} URL(s).")
-            else:
-                parts = [p.strip() for p in sel.split(",") if p.strip()]
-                if not parts:
-                    print("No valid selection entered. Returning to menu.")
-                    continue
-                for p in parts:
-                    if not p.isdigit():
-                        print(f"Skipping invalid selection: {p!r}")
-                        continue
-                    i = int(p)
-                    if 1 <= i <= len(paused_urls):
-                        crawler.resume_url(paused_urls[i - 1])
-                        resumed_count += 1
-                    else:
-                        print(f"Index out of range: {i}")
-                if resumed_count > 0:
-                    print(f"\nResumed {resumed_count} URL(s).")
-
-            if resumed_count > 0:
-                crawler.start_workers()
-                print("Crawler started. Type 'help' for commands.")
-                break
-            else:
-                print("No URLs were resumed. Returning to menu.")
-        elif choice == "4":
-            # Pause a URL
-            url_to_pause = input("Enter URL to pause (leave blank to cancel): ").strip()
-            if url_to_pause:
-                crawler.pause_url(url_to_pause)
-                print()  # Add blank line for clarity
-            # Loop back to show updated counts and options again
-        elif choice == "5":
-            # List pending URLs by prefix
-            prefix = input("Enter URL prefix to list pending (leave blank to cancel): ").strip()
-            if prefix:
-                # Show a few examples and count
+    try:
+        with output_guard:
+            while True:
                 try:
-                    pending_urls = [u for u in crawler.db.load_pending_urls() if u.startswith(prefix)]
-                except Exception:
-                    pending_urls = []
-                print(f"Found {len(pending_urls)} pending URL(s) with prefix {prefix!r}:")
-                for u in pending_urls[:20]:
-                    print(f"  {u}")
-                if len(pending_urls) > 20:
-                    print("  ... (truncated)")
-                print()
-            # Loop back
-        elif choice == "6":
-            # Pause URLs by prefix before starting
-            prefix = input("Enter URL prefix to pause (leave blank to cancel): ").strip()
-            if prefix:
-                crawler.pause_prefix(prefix)
-                print()  # blank line
-            # Loop back
-        elif choice == "7":
-            crawler.print_stats()
-            # Loop back to menu after showing stats
-            continue
-        elif choice == "8":
-            print("Exiting without starting crawler.")
-            return
-        else:
-            print("Invalid option, please choose a number between 1 and 7.")
+                    cmd_line = read_command().strip()
+                except EOFError:
+                    # Treat EOF as stop
+                    break
 
-    # Command loop (runs after workers have started)
-    try:
-        while True:
-            try:
-                cmd_line = input("> ").strip()
-            except EOFError:
-                # Treat EOF as stop
-                break
+                if not cmd_line:
+                    continue
 
-            if not cmd_line:
-                continue
+                parts = cmd_line.split(maxsplit=1)
+                cmd = parts[0].lower()
+                arg = parts[1] if len(parts) > 1 else ""
 
-            parts = cmd_line.split(maxsplit=1)
-            cmd = parts[0].lower()
-            arg = parts[1] if len(parts) > 1 else ""
-
-            if cmd in ("quit", "stop", "exit"):
-                crawler.stop()
-                break
-            elif cmd == "help":
-                print(
-                    "Commands:\n"
-                    "  seed <url>            - add a new seed URL (page or sitemap)\n"
-                    "  pause <url>           - pause a single URL\n"
-                    "  pause-prefix <prefix> - pause all pending URLs with given prefix\n"
-                    "  resume <url>          - resume a paused URL\n"
-                    "  resume-prefix <prefix>- resume paused URLs with prefix\n"
-                    "  stats                 - show crawler statistics and top paused domains\n"
-                    "  status                - show worker & URL counts\n"
-                    "  stop / quit           - save state and exit\n"
-                    "  help                  - show this help\n"
-                )
-            elif cmd == "seed":
-                if not arg:
-                    print("Usage: seed <url>")
+                if cmd in _QUIT_COMMANDS:
+                    break
+                entry = _COMMANDS.get(cmd)
+                if entry is None:
+                    print(f"Unknown command: {cmd!r}. Type 'help' for list of commands.")
                     continue
-                crawler.add_seed_url(arg)
-            elif cmd == "pause":
-                if not arg:
-                    print("Usage: pause <url>")
+                handler, usage = entry
+                if usage and not arg:
+                    print(f"Usage: {usage}")
                     continue
-                crawler.pause_url(arg)
-            elif cmd == "pause-prefix":
-                if not arg:
-                    print("Usage: pause-prefix <prefix>")
-                    continue
-                crawler.pause_prefix(arg)
-            elif cmd == "resume":
-                if not arg:
-                    print("Usage: resume <url>")
-                    continue
-                crawler.resume_url(arg)
-            elif cmd == "resume-prefix":
-                if not arg:
-                    print("Usage: resume-prefix <prefix>")
-                    continue
-                crawler.resume_prefix(arg)
-            elif cmd == "stats":
-                crawler.print_stats()
-            elif cmd == "status":
-                crawler.print_status()
-            else:
-                print(f"Unknown command: {cmd!r}. Type 'help' for list of commands.")
+                handler(crawler, arg)
+        crawler.stop()
 
     except KeyboardInterrupt:
         print("\nKeyboard interrupt received.")
@@ -1,6 +1,239 @@
-from typing import Dict
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from html import unescape
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
 
-from bs4 import BeautifulSoup
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # optional C parser; fall back to html.parser
+    LexborHTMLParser = None
+try:
+    import xxhash
+except ImportError:  # optional fast hash; fall back to hashlib.blake2b
+    xxhash = None
+
+
+CONTENT_CHARS = 500
+# Only the title and a short text prefix are kept, so parse a bounded prefix
+MAX_HTML_CHARS = 256 * 1024
+# Elements whose contents never count as page text (shared with crawler.py)
+NON_TEXT_TAGS = frozenset({"script", "style", "noscript", "template"})
+
+# Identical bodies served under different URLs are only extracted once
+SCRAPE_CACHE_SIZE = 10_000
+_scrape_cache: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()
+_scrape_cache_lock = threading.Lock()
+
+# Regex fast path: enough markup is scanned to cover the title and content budget.
+# Every scan below resumes where the previous one stopped, so the cost stays
+# linear in the window even on hostile markup (no retries from each "<").
+FAST_PATH_CHARS = 32 * 1024
+_TITLE_START_RE = re.compile(r"<title\b", re.IGNORECASE)
+_TITLE_RE = re.compile(r"<title\b[^<>]*>([^<]*)</title\s*>", re.IGNORECASE)
+_SKIP_START_RE = re.compile(r"<(%s)\b|<!--" % "|".join(sorted(NON_TEXT_TAGS)), re.IGNORECASE)
+_SKIP_END_RE = {
+    name: re.compile(r"</%s\b[^<>]*>" % name, re.IGNORECASE) for name in NON_TEXT_TAGS
+}
+# Only real tag starts; quoted attribute values may contain ">"
+_TAG_START_RE = re.compile(r"<[A-Za-z/!?]")
+_TAG_STOP_RE = re.compile(r"""[>"']""")
+# Stands in for a removed block: an empty comment still ends the text run before it
+_BLOCK_GAP = "<!>"
+
+
+def has_non_text_ancestor(node) -> bool:
+    """True if a selectolax node sits anywhere inside a NON_TEXT_TAGS element."""
+    node = node.parent
+    while node is not None:
+        if node.tag in NON_TEXT_TAGS:
+            return True
+        node = node.parent
+    return False
+
+
+def _strip_non_text(window: str) -> Optional[str]:
+    """Replace NON_TEXT_TAGS blocks and comments with _BLOCK_GAP, or None if one is unterminated."""
+    pieces: List[str] = []
+    pos = 0
+    while True:
+        m = _SKIP_START_RE.search(window, pos)
+        if m is None:
+            pieces.append(window[pos:])
+            return _BLOCK_GAP.join(pieces)
+        pieces.append(window[pos:m.start()])
+        if m.group(1) is None:
+            end = window.find("-->", m.end())
+            if end < 0:
+                return None
+            pos = end + 3
+        else:
+            end_m = _SKIP_END_RE[m.group(1).lower()].search(window, m.end())
+            if end_m is None:
+                return None
+            pos = end_m.end()
+
+
+def _tag_end(body: str, start: int) -> int:
+    """Index just past the tag opened at `start`, skipping quoted ">"; -1 if unterminated."""
+    pos = start + 1
+    while True:
+        m = _TAG_STOP_RE.search(body, pos)
+        if m is None:
+            return -1
+        if m.group() == ">":
+            return m.end()
+        close = body.find(m.group(), m.end())
+        if close < 0:
+            return -1
+        pos = close + 1
+
+
+def _fast_title_and_text(html: str) -> Optional[Tuple[str, str]]:
+    """
+    Extract title and text with a few linear scans instead of a parse.
+    Returns None when the result can't be trusted (no well-formed <title>, a
+    script/style block, comment or tag cut off by the scan window, or too
+    little text within the window).
+    """
+    # Scripts and comments go first, so a "<title>" inside one can't win
+    stripped = _strip_non_text(html[:FAST_PATH_CHARS])
+    if stripped is None:
+        return None
+    start = _TITLE_START_RE.search(stripped)
+    if start is None:
+        return None
+    m = _TITLE_RE.match(stripped, start.start())
+    if m is None:
+        return None
+    title = unescape(m.group(1)).strip()
+
+    body = stripped[:m.start()] + _BLOCK_GAP + stripped[m.end():]
+    # Same joining as the parser paths: each text run stripped, joined by spaces
+    parts = [title] if title else []
+    text_len = len(title) + 1 if title else 0
+    pos = 0
+    while text_len < CONTENT_CHARS:
+        tag = _TAG_START_RE.search(body, pos)
+        chunk = body[pos:tag.start()] if tag is not None else body[pos:]
+        chunk = unescape(chunk).strip()
+        if chunk:
+            parts.append(chunk)
+            text_len += len(chunk) + 1
+        if tag is None:
+            break
+        pos = _tag_end(body, tag.start())
+        if pos < 0:
+            # Unterminated tag or unbalanced quote; let a real parser decide
+            return None
+    text = " ".join(parts)
+    if len(text) < CONTENT_CHARS and len(html) > FAST_PATH_CHARS:
+        return None
+    return title, text
+
+
+def _selectolax_title_and_text(html: str):
+    tree = LexborHTMLParser(html)
+    title_node = tree.css_first("title")
+    title = title_node.text(strip=True) if title_node else ""
+
+    # Walk text nodes in document order and stop once enough text is collected
+    parts: List[str] = []
+    text_len = 0
+    for node in tree.root.traverse(include_text=True):
+        if node.tag != "-text":
+            continue
+        chunk = node.text_content.strip()
+        if chunk and not has_non_text_ancestor(node):
+            parts.append(chunk)
+            text_len += len(chunk) + 1
+            if text_len >= CONTENT_CHARS:
+                break
+    return title, " ".join(parts)
+
+
+class _Done(Exception):
+    """Raised from _Extractor callbacks to stop feeding once enough is collected."""
+
+
+class _Extractor(HTMLParser):
+    """
+    Streaming title/text extractor: no tree is built, and parsing stops once
+    the title is known and CONTENT_CHARS of text have been collected.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.in_title = False
+        self.title: Optional[str] = None
+        self.title_parts: List[str] = []
+        self.text_parts: List[str] = []
+        self.text_len = 0
+        self.skip_depth = 0
+        self.in_body = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self.in_title = True
+        elif tag in NON_TEXT_TAGS:
+            self.skip_depth += 1
+        elif tag == "body":
+            self.in_body = True
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self.in_title:
+            self.in_title = False
+            if self.title is None:
+                self.title = "".join(self.title_parts).strip()
+        elif tag in NON_TEXT_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if self.in_title:
+            self.title_parts.append(data)
+        if self.text_len >= CONTENT_CHARS:
+            return
+        chunk = data.strip()
+        if chunk:
+            self.text_parts.append(chunk)
+            self.text_len += len(chunk) + 1
+            # A <title> can't appear once <body> has started
+            if self.text_len >= CONTENT_CHARS and (self.title is not None or self.in_body):
+                raise _Done
+
+
+def _stdlib_title_and_text(html: str):
+    parser = _Extractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except _Done:
+        pass
+    title = parser.title
+    if title is None:
+        # Unclosed <title>: use whatever was collected
+        title = "".join(parser.title_parts).strip()
+    return title, " ".join(parser.text_parts)
+
+
+def _content_hash(html: str) -> int:
+    data = html.encode("utf-8", "surrogatepass")
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(data)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def _extract_title_and_text(html: str) -> Tuple[str, str]:
+    fast = _fast_title_and_text(html)
+    if fast is not None:
+        return fast
+    if LexborHTMLParser is not None:
+        return _selectolax_title_and_text(html)
+    return _stdlib_title_and_text(html)
 
 
 def scrape_html(url: str, html: str, status_code: int) -> Dict:
@@ -15,21 +248,27 @@ def scrape_html(url: str, html: str, status_code: int) -> Dict:
             'content': <first 500 chars of text>,
         }
     """
-    soup = BeautifulSoup(html, "html.parser")
-
-    title = ""
-    if soup.title and soup.title.string:
-        title = soup.title.string.strip()
-
-    text_content = soup.get_text(separator=" ", strip=True)
+    html = html[:MAX_HTML_CHARS]
+    key = _content_hash(html)
+    with _scrape_cache_lock:
+        cached = _scrape_cache.get(key)
+        if cached is not None:
+            _scrape_cache.move_to_end(key)
+    if cached is not None:
+        title, text_content = cached
+    else:
+        title, text_content = _extract_title_and_text(html)
+        text_content = text_content[:CONTENT_CHARS]
+        with _scrape_cache_lock:
+            _scrape_cache[key] = (title, text_content)
+            if len(_scrape_cache) > SCRAPE_CACHE_SIZE:
+                _scrape_cache.popitem(last=False)
 
     data = {
         "url": url,
         "title": title,
         "status_code": status_code,
-        "content": text_content[:500],
+        "content": text_content[:CONTENT_CHARS],
     }
 
     return data
-
-
@@ -0,0 +1,16 @@
+import re
+from functools import lru_cache
+
+
+# [scheme://][userinfo@][www.]host[:port] -> host[:port]
+_HOST_RE = re.compile(r"^(?:[a-z][a-z0-9+.-]*://)?(?:[^@/?#]*@)?(?:www\.)?([^/?#]*)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=65536)
+def canon_host(url_or_host: str) -> str:
+    """
+    Lowercased host[:port] with any leading "www." removed. Accepts a full URL
+    or a bare host, so stored URLs and user-typed domains compare equal.
+    """
+    m = _HOST_RE.match(url_or_host.strip())
+    return m.group(1).lower() if m else ""
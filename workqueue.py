@@ -0,0 +1,97 @@
+import itertools
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+
+class WorkStealingQueue:
+    """
+    Crawl frontier split into one deque per worker:
+    - Owners push/pop at the bottom (right end) of their own deque
+    - Idle workers steal from the top (left end) of a random peer
+    - Each deque has its own lock, so workers never contend on one queue mutex
+
+    Pausing by prefix does not touch the deques. The pause is stamped with an
+    epoch, and entries queued before it are dropped when they are popped.
+    """
+
+    def __init__(self, num_workers: int):
+        n = max(1, num_workers)
+        self._deques: List[Deque[Tuple[int, str]]] = [deque() for _ in range(n)]
+        self._locks = [threading.Lock() for _ in range(n)]
+        self._round_robin = itertools.count()
+        self._epoch = itertools.count(1)
+        self._paused_prefixes: List[Tuple[int, str]] = []
+        self._not_empty = threading.Event()
+
+    def put(self, url: str, worker: Optional[int] = None) -> None:
+        """Queue `url` on `worker`'s deque, or round-robin when no worker is given."""
+        if worker is None:
+            worker = next(self._round_robin) % len(self._deques)
+        item = (next(self._epoch), url)
+        with self._locks[worker]:
+            self._deques[worker].append(item)
+        self._not_empty.set()
+
+    def get(self, worker: int, timeout: Optional[float] = None) -> str:
+        """
+        Pop the next URL for `worker`, stealing from peers when its own deque is
+        empty. Raises queue.Empty if nothing arrives within `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            item = self._pop_local(worker) or self._steal(worker)
+            if item is None:
+                # Re-check after clearing so a concurrent put() can't be missed
+                self._not_empty.clear()
+                item = self._pop_local(worker) or self._steal(worker)
+
+            if item is not None:
+                epoch, url = item
+                if self._is_paused(epoch, url):
+                    continue
+                return url
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise queue.Empty
+            if not self._not_empty.wait(remaining):
+                raise queue.Empty
+
+    def drop_prefix(self, prefix: str) -> None:
+        """Skip every URL starting with `prefix` that is currently queued."""
+        # list.append is atomic; readers only ever see complete entries
+        self._paused_prefixes.append((next(self._epoch), prefix))
+
+    def __len__(self) -> int:
+        return sum(len(d) for d in self._deques)
+
+    # ------------------------------------------------------------
+    # Internal helpers
+    # ------------------------------------------------------------
+    def _pop_local(self, worker: int) -> Optional[Tuple[int, str]]:
+        with self._locks[worker]:
+            if self._deques[worker]:
+                return self._deques[worker].pop()
+        return None
+
+    def _steal(self, worker: int) -> Optional[Tuple[int, str]]:
+        n = len(self._deques)
+        start = random.randrange(n)
+        for offset in range(n):
+            victim = (start + offset) % n
+            if victim == worker:
+                continue
+            with self._locks[victim]:
+                if self._deques[victim]:
+                    return self._deques[victim].popleft()
+        return None
+
+    def _is_paused(self, epoch: int, url: str) -> bool:
+        for paused_epoch, prefix in self._paused_prefixes:
+            if paused_epoch > epoch and url.startswith(prefix):
+                return True
+        return False